@@ -29,108 +29,107 @@
 def calc_variables ( ):
     """Calculates all variables of interest.
     
-    They are collected and returned as a list, for use in the main program.
+    They are stored in the list variables, defined at the start of the run,
+    which is returned for use in the main program.
     """
 
-    from averages_module import msd, VariableType
-    from lrc_module import potential_lrc, pressure_lrc
-    import numpy as np
-    import math
-
     # Preliminary calculations (n,v,f,total are taken from the calling program)
-    vol = box**3                  # Volume
-    rho = n / vol                 # Density
-    kin = 0.5*np.sum(v**2)        # Kinetic energy
-    fsq = np.sum ( f**2 )         # Total squared force
-
-    # Variables of interest, of class VariableType, containing three attributes:
-    #   .val: the instantaneous value
-    #   .nam: used for headings
-    #   .method: indicating averaging method
-    # If not set below, .method adopts its default value of avg
-    # The .nam and some other attributes need only be defined once, at the start of the program,
-    # but for clarity and readability we assign all the values together below
+    v_1d = v.ravel(order='K')     # Velocities as a 1D view, without copying
+    f_1d = f.ravel(order='K')     # Forces as a 1D view, without copying
+    kin = 0.5*float(np.dot(v_1d,v_1d)) # Kinetic energy, as a double precision float
+    fsq = float(np.dot(f_1d,f_1d))     # Total squared force, as a double precision float
+
+    return set_variables ( kin, fsq, total.pot, total.cut, total.vir, total.lap )
+
+def set_variables ( kin, fsq, pot, cut, vir, lap ):
+    """Sets the values of all variables of interest from kinetic energy, squared force and potential totals.
+
+    They are stored in the list variables, defined at the start of the run,
+    which is returned for use in the main program.
+    """
+
+    # Quantities that are constant throughout the run are computed once, in the main program
+    # Only the .val attribute of each variable is updated here
 
     # Internal energy (cut-and-shifted) per atom
     # Total KE plus total cut-and-shifted PE divided by N
-    e_s = VariableType ( nam = 'E/N cut&shifted', val = (kin+total.pot)/n )
+    e_s.val = (kin+pot)*inv_n
 
     # Internal energy (full, including LRC) per atom
     # LRC plus total KE plus total cut (but not shifted) PE divided by N
-    e_f = VariableType ( nam = 'E/N full', val = potential_lrc(rho,r_cut) + (kin+total.cut)/n )
+    e_f.val = pot_lrc + (kin+cut)*inv_n
 
     # Pressure (cut-and-shifted)
     # Ideal gas contribution plus total virial divided by V
-    p_s = VariableType ( nam = 'P cut&shifted', val = rho*temperature + total.vir/vol )
+    p_s.val = prs_ideal + vir*inv_vol
 
     # Pressure (full, including LRC)
     # LRC plus ideal gas contribution plus total virial divided by V
-    p_f = VariableType ( nam = 'P full', val = pressure_lrc(rho,r_cut) + rho*temperature + total.vir/vol )
+    p_f.val = prs_lrc + prs_ideal + vir*inv_vol
 
     # Kinetic temperature
     # Momentum is not conserved, hence 3N degrees of freedom
-    t_k = VariableType ( nam = 'T kinetic', val = 2.0*kin/(3*n) )
+    t_k.val = 2.0*kin*inv_3n
 
     # Configurational temperature
     # Total squared force divided by total Laplacian
-    t_c = VariableType ( nam = 'T config', val = fsq/total.lap )
+    t_c.val = fsq/lap
 
     # Heat capacity (cut-and-shifted)
     # Total energy divided by temperature and sqrt(N) to make result intensive
-    c_s = VariableType ( nam = 'Cv/N cut&shifted', val = (kin+total.pot)/(temperature*math.sqrt(n)),
-                         method = msd, instant = False )
+    c_s.val = (kin+pot)*inv_t_sqrt_n
 
     # Heat capacity (full)
     # Total energy divided by temperature and sqrt(N) to make result intensive; LRC does not contribute
-    c_f = VariableType ( nam = 'Cv/N full', val = (kin+total.cut)/(temperature*math.sqrt(n)),
-                         method = msd, instant = False )
+    c_f.val = (kin+cut)*inv_t_sqrt_n
 
-    # Collect together into a list for averaging
-    return [ e_s, p_s, e_f, p_f, t_k, t_c, c_s, c_f ]
+    return variables
 
-def a_propagator ( t ):
-    """A: drift step propagator.
+def baoab_step ( ):
+    """Advances positions, velocities and forces through one BAOAB step, of length dt.
 
-    t is the time over which to propagate (typically dt/2).
-    r, v, and box are accessed from the calling program.
+    The B, A, O, A propagators, the force evaluation, and the final B propagator are applied
+    in place, using the scratch arrays tmp and noise, so that no temporary arrays are created.
+    r, v, f, total, tmp, noise, rng, box, inv_box, r_cut, dt, o_exp, and o_ran are accessed from the calling program.
     """
 
-    global r
-    import numpy as np
-    
-    r = r + t * v / box   # Positions in box=1 units
-    r = r - np.rint ( r ) # Periodic boundaries
+    global r, v, f, total
 
-def b_propagator ( t ):
-    """B: kick step propagator.
+    half_t     = 0.5*dt
+    half_t_box = half_t*inv_box # Drift factor, positions in box=1 units
 
-    t is the time over which to propagate (typically dt/2).
-    v is accessed from the calling program.
-    """
+    np.multiply ( f, half_t, out=tmp )     # B kick half-step
+    v += tmp
 
-    global v
-    v = v + t * f
+    np.multiply ( v, half_t_box, out=tmp ) # A drift half-step, positions in box=1 units
+    r += tmp
+    np.rint ( r, out=tmp )                 # Periodic boundaries
+    r -= tmp
 
-def o_propagator ( t ):
-    """O: friction and random contributions propagator.
+    rng.standard_normal ( out=noise, dtype=noise.dtype ) # O random velocities and friction step
+    np.multiply ( noise, o_ran, out=noise )
+    v *= o_exp
+    v += noise
 
-    t is the time over which to propagate (typically dt).
-    v, n, temperature, and gamma are accessed from the calling program.
-    """
+    np.multiply ( v, half_t_box, out=tmp ) # A drift half-step, positions in box=1 units
+    r += tmp
+    np.rint ( r, out=tmp )                 # Periodic boundaries
+    r -= tmp
 
-    global v
-    import numpy as np
+    total, f = force ( box, r_cut, r )     # Force evaluation
+    assert not total.ovr, 'Overlap in configuration' # Skipped if run with python -O
 
-    x = gamma*t
-    c = 1-np.exp(-2*x) if x > 0.0001 else np.polyval([-2/3,4/3,-2.0,2.0,0.0],x)
-    c = np.sqrt(c)
-    v = v*np.exp(-x) + c*np.sqrt(temperature)*np.random.randn(n,3)
+    np.multiply ( f, half_t, out=tmp )     # B kick half-step
+    v += tmp
  
 # Takes in a configuration of atoms (positions, velocities)
 # Cubic periodic boundary conditions
 # Conducts molecular dynamics using BAOAB algorithm of BJ Leimkuhler and C Matthews
 # Appl. Math. Res. eXpress 2013, 34–56 (2013); J. Chem. Phys. 138, 174102 (2013)
-# Uses no special neighbour lists
+# For large enough systems, uses a Verlet neighbour list built with link cells
+
+# Overlaps are checked at every step with an assert statement; for production runs,
+# running the program with python -O removes this check from the step loop
 
 # Reads several variables and options from standard input using JSON format
 # Leave input empty "{}" to accept supplied defaults
@@ -139,29 +138,51 @@ def o_propagator ( t ):
 # However, input configuration, output configuration, most calculations, and all results 
 # are given in simulation units defined by the model
 # For example, for Lennard-Jones, sigma = 1, epsilon = 1
+# Positions and velocities are stored as separate contiguous arrays of x, y and z components,
+# accessed as n*3 arrays (Fortran order); the propagators update them in place
 
 # Despite the program name, there is nothing here specific to Lennard-Jones
-# The model is defined in md_lj_module
-
+# The model is defined in the first of the following modules that can be imported
+# md_lj_vl_module is skipped unless the box is large enough to divide into at least 3 link cells
+# in each direction; for smaller systems the all-pairs routines are faster
+# The .pyx modules are compiled on first import using pyximport, if Cython and a C compiler are available
+force_modules = [ 'md_lj_vl_module',     # Verlet neighbour list built with link cells, compiled using Numba
+                  'md_lj_simd_module',   # C, vectorized with AVX-512 or AVX2 intrinsics, and OpenMP
+                  'md_lj_cython_module', # Cython, parallelized with OpenMP
+                  'md_lj_numba_module',  # Compiled using Numba
+                  'md_lj_module' ]       # NumPy
+
+# Positions, velocities and forces are stored in double precision, unless single is set True
+# Only md_lj_simd_module has a single-precision force kernel, which accumulates totals in double precision;
+# the other modules accept single-precision coordinates, but gain nothing from them
+single = False # Change this to use single precision, doubling the SIMD width of the force kernel
+
+# The GPU force routine md_lj_cuda_module is only tried if gpu is set True, and then after md_lj_vl_module
+# Its kernel loops over all pairs, and positions and forces are copied between host and GPU at every step
+gpu = False # Change this to use a CUDA device, if present, for systems too small for md_lj_vl_module
+
+# The functions above are called at every step, so the modules they need are imported once, here
 import json
 import sys
+import importlib
 import numpy as np
 import math
+from concurrent.futures import ThreadPoolExecutor
 from config_io_module import read_cnf_atoms, write_cnf_atoms
-from averages_module import run_begin, run_end, blk_begin, blk_end, blk_add
-from md_lj_module import introduction, conclusion, force, PotentialType
+from averages_module  import run_begin, run_end, blk_begin, blk_end, blk_add, msd, VariableType
+from lrc_module       import potential_lrc, pressure_lrc
+try:
+    import pyximport                       # Compiles .pyx modules on first import
+    pyximport.install ( language_level=3 )
+except ImportError:
+    pass
 
 cnf_prefix = 'cnf.'
 inp_tag    = 'inp'
 out_tag    = 'out'
 sav_tag    = 'sav'
 
-print('bd_nvt_lj')
-print('Brownian dynamics, constant-NVT ensemble')
-print('Particle mass=1 throughout')
-introduction()
-
-np.random.seed()
+rng = np.random.default_rng() # Random number generator, seeded afresh for each run
 
 # Read parameters in JSON format
 try:
@@ -186,6 +207,32 @@ dt          = nml["dt"]          if "dt"          in nml else defaults["dt"]
 temperature = nml["temperature"] if "temperature" in nml else defaults["temperature"]
 gamma       = nml["gamma"]       if "gamma"       in nml else defaults["gamma"]
 
+# Read in initial configuration
+n, box, r, v = read_cnf_atoms ( cnf_prefix+inp_tag, with_v=True)
+
+# Choose the force module, now that the system size is known
+if gpu:
+    force_modules.insert ( force_modules.index('md_lj_vl_module')+1, 'md_lj_cuda_module' ) # GPU, using Numba CUDA
+for force_module_name in force_modules:    # Take the first of these that can be imported
+    try:
+        force_module = importlib.import_module ( force_module_name )
+    except ImportError:
+        continue
+    if hasattr ( force_module, 'link_cells' ) and not force_module.link_cells ( box, r_cut ):
+        continue                           # Verlet list without link cells is slower than the all-pairs routines
+    break
+introduction  = force_module.introduction
+conclusion    = force_module.conclusion
+force         = force_module.force
+PotentialType = force_module.PotentialType
+run_block     = getattr ( force_module, 'run_block', None ) # Compiled loop over the steps of a block, if provided
+real          = np.float32 if single else np.float64
+
+print('bd_nvt_lj')
+print('Brownian dynamics, constant-NVT ensemble')
+print('Particle mass=1 throughout')
+introduction()
+
 # Write out parameters
 print( "{:40}{:15d}  ".format('Number of blocks',          nblock)            )
 print( "{:40}{:15d}  ".format('Number of steps per block', nstep)             )
@@ -195,47 +242,104 @@ print( "{:40}{:15.6f}".format('Friction coefficient',      gamma)             )
 print( "{:40}{:15.6f}".format('Specified temperature',     temperature)       )
 print( "{:40}{:15.6f}".format('Ideal diffusion coefft',    temperature/gamma) )
 
-# Read in initial configuration
-n, box, r, v = read_cnf_atoms ( cnf_prefix+inp_tag, with_v=True)
+# Coefficients for the O propagator depend only on dt, gamma, and temperature, so are computed once
+x     = gamma*dt
+c     = 1-math.exp(-2*x) if x > 0.0001 else np.polyval([-2/3,4/3,-2.0,2.0,0.0],x)
+o_exp = math.exp(-x)               # Friction factor applied to velocities
+o_ran = math.sqrt(c*temperature)   # Factor applied to random velocities
+
+# Initial configuration
 print( "{:40}{:15d}  ".format('Number of particles',          n) )
 print( "{:40}{:15.6f}".format('Box length', box)  )
 print( "{:40}{:15.6f}".format('Density', n/box**3)  )
-r = r / box                    # Convert positions to box units
+inv_box = 1.0 / box            # Positions are multiplied by this, rather than divided by box
+r = r * inv_box                # Convert positions to box units
 r = r - np.rint ( r )          # Periodic boundaries
+r = np.asfortranarray ( r, dtype=real ) # Contiguous x, y and z components
+v = np.asfortranarray ( v, dtype=real ) # Contiguous x, y and z components
+tmp   = np.empty_like ( r )    # Scratch array used in baoab_step
+noise = np.empty_like ( r )    # Random numbers used in baoab_step, generated in place
+r_out = np.empty_like ( r )    # Positions in simulation units, for output
+
+# Quantities used in calc_variables, which are constant throughout the run
+vol          = box**3                           # Volume
+rho          = n / vol                          # Density
+inv_n        = 1.0 / n                          # For quantities per atom
+inv_3n       = 1.0 / (3*n)                      # For kinetic temperature, with 3N degrees of freedom
+inv_vol      = 1.0 / vol                        # For virial contribution to pressure
+inv_t_sqrt_n = 1.0 / (temperature*math.sqrt(n)) # For heat capacities
+pot_lrc      = potential_lrc ( rho, r_cut )     # Long-range correction to energy per atom
+prs_lrc      = pressure_lrc ( rho, r_cut )      # Long-range correction to pressure
+prs_ideal    = rho * temperature                # Ideal gas contribution to pressure
 
 # Initial forces, potential, etc plus overlap check
 total, f = force ( box, r_cut, r )
 assert not total.ovr, 'Overlap in initial configuration'
 
+# Variables of interest, of class VariableType, containing three attributes:
+#   .val: the instantaneous value
+#   .nam: used for headings
+#   .method: indicating averaging method
+# If not set below, .method adopts its default value of avg
+# The variables are created once, here, and their values are updated at each step by calc_variables
+e_s = VariableType ( nam = 'E/N cut&shifted',  val = 0.0 )
+e_f = VariableType ( nam = 'E/N full',         val = 0.0 )
+p_s = VariableType ( nam = 'P cut&shifted',    val = 0.0 )
+p_f = VariableType ( nam = 'P full',           val = 0.0 )
+t_k = VariableType ( nam = 'T kinetic',        val = 0.0 )
+t_c = VariableType ( nam = 'T config',         val = 0.0 )
+c_s = VariableType ( nam = 'Cv/N cut&shifted', val = 0.0, method = msd, instant = False )
+c_f = VariableType ( nam = 'Cv/N full',        val = 0.0, method = msd, instant = False )
+
+# Collect together into a list for averaging
+variables = [ e_s, p_s, e_f, p_f, t_k, t_c, c_s, c_f ]
+
 # Initialize arrays for averaging and write column headings
 run_begin ( calc_variables() )
 
+# Configurations are saved at the end of each block by a background thread, while the next block runs
+# It works on copies of the positions (converted to simulation units) and velocities
+io_pool    = ThreadPoolExecutor ( max_workers=1 )
+sav_future = None
+
 for blk in range(1,nblock+1): # Loop over blocks
 
     blk_begin()
 
-    for stp in range(nstep): # Loop over steps
+    if run_block is None:
 
-        b_propagator ( dt/2 ) # B kick half-step
-        a_propagator ( dt/2 ) # A drift half-step
-        o_propagator ( dt )   # O random velocities and friction step
-        a_propagator ( dt/2 ) # A drift half-step
+        for stp in range(nstep): # Loop over steps
 
-        total, f = force ( box, r_cut, r ) # Force evaluation
-        assert not total.ovr, 'Overlap in configuration'
+            baoab_step ( ) # BAOAB step, including force evaluation
 
-        b_propagator ( dt/2 ) # B kick half-step
+            blk_add ( calc_variables() )
 
-        blk_add ( calc_variables() )
+    else:
+
+        # All the steps of the block, including force evaluation, are taken in one call
+        # The overlap check is then made once per block, and the averages are accumulated afterwards
+        total, f, steps = run_block ( box, r_cut, dt, o_exp, o_ran, rng, nstep, r, v, f )
+        assert not total.ovr, 'Overlap in configuration' # Skipped if run with python -O
 
-    blk_end(blk)                                             # Output block averages
-    sav_tag = str(blk).zfill(3) if blk<1000 else 'sav'       # Number configuration by block
-    write_cnf_atoms ( cnf_prefix+sav_tag, n, box, r*box, v ) # Save configuration
+        for kin, fsq, pot, cut, vir, lap in steps.T.tolist(): # Loop over steps
+            blk_add ( set_variables ( kin, fsq, pot, cut, vir, lap ) )
+
+    blk_end(blk)                                               # Output block averages
+    sav_tag = str(blk).zfill(3) if blk<1000 else 'sav'         # Number configuration by block
+    if sav_future is not None:
+        sav_future.result()                                    # Wait for previous save, raising any error in it
+    sav_future = io_pool.submit ( write_cnf_atoms, cnf_prefix+sav_tag, n, box,
+                                  r*box, v.copy() )            # Save snapshot of configuration in background
 
 run_end ( calc_variables() )
 
+io_pool.shutdown ( wait=True ) # Wait for the last block's save to finish
+if sav_future is not None:
+    sav_future.result()        # Raises any error in the last save
+
 total, f = force ( box, r_cut, r ) # Force evaluation
 assert not total.ovr, 'Overlap in final configuration'
 
-write_cnf_atoms ( cnf_prefix+out_tag, n, box, r*box, v ) # Save configuration
+np.multiply ( r, box, out=r_out )                        # Convert positions to simulation units
+write_cnf_atoms ( cnf_prefix+out_tag, n, box, r_out, v ) # Save configuration
 conclusion()
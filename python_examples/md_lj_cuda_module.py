@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# md_lj_cuda_module.py
+
+#------------------------------------------------------------------------------------------------#
+# This software was written in 2016/17                                                           #
+# by Michael P. Allen <m.p.allen@warwick.ac.uk>/<m.p.allen@bristol.ac.uk>                        #
+# and Dominic J. Tildesley <d.tildesley7@gmail.com> ("the authors"),                             #
+# to accompany the book "Computer Simulation of Liquids", second edition, 2017 ("the text"),     #
+# published by Oxford University Press ("the publishers").                                       #
+#                                                                                                #
+# LICENCE                                                                                        #
+# Creative Commons CC0 Public Domain Dedication.                                                 #
+# To the extent possible under law, the authors have dedicated all copyright and related         #
+# and neighboring rights to this software to the PUBLIC domain worldwide.                        #
+# This software is distributed without any warranty.                                             #
+# You should have received a copy of the CC0 Public Domain Dedication along with this software.  #
+# If not, see <http://creativecommons.org/publicdomain/zero/1.0/>.                               #
+#                                                                                                #
+# DISCLAIMER                                                                                     #
+# The authors and publishers make no warranties about the software, and disclaim liability       #
+# for all uses of the software, to the fullest extent permitted by applicable law.               #
+# The authors and publishers do not recommend use of this software for any purpose.              #
+# It is made freely available, solely to clarify points made in the text. When using or citing   #
+# the software, you should not imply endorsement by the authors or publishers.                   #
+#------------------------------------------------------------------------------------------------#
+
+"""Force routine for MD simulation, Lennard-Jones atoms, offloaded to a GPU using Numba CUDA."""
+
+import math
+import numpy as np
+from numba import cuda, float64
+
+if not cuda.is_available():
+    raise ImportError('No CUDA GPU available')
+
+threads = 128 # Threads per block, sharing the inner loop over j for each atom i; must be a power of 2
+
+class PotentialType:
+    """A composite variable for interactions."""
+
+    __slots__ = ('cut','pot','vir','lap','ovr') # Fixed attributes, stored without an instance dictionary
+
+    def __init__(self, cut, pot, vir, lap, ovr):
+        self.cut = cut # the potential energy cut (but not shifted) at r_cut
+        self.pot = pot # the potential energy cut-and-shifted at r_cut
+        self.vir = vir # the virial
+        self.lap = lap # the Laplacian
+        self.ovr = ovr # a flag indicating overlap (i.e. pot too high to use)
+
+    def __add__(self, other):
+        cut = self.cut +  other.cut
+        pot = self.pot +  other.pot
+        vir = self.vir +  other.vir
+        lap = self.lap +  other.lap
+        ovr = self.ovr or other.ovr
+
+        return PotentialType(cut,pot,vir,lap,ovr)
+
+def introduction():
+    """Prints out introductory statements at start of run."""
+    
+    print('Lennard-Jones potential')
+    print('Cut-and-shifted version for dynamics')
+    print('Cut (but not shifted) version also calculated')
+    print('Diameter, sigma = 1')
+    print('Well depth, epsilon = 1')
+    print('Fast force routine on GPU, using Numba CUDA')
+
+def conclusion():
+    """Prints out concluding statements at end of run."""
+
+    print('Program ends')
+
+# Arrays on the GPU, allocated on the first call of force, and reused while n is unchanged
+d_r, d_f, d_totals = None, None, None
+
+def force ( box, r_cut, r ):
+    """Takes in box, cutoff range, and coordinate array, and calculates forces and potentials etc."""
+
+    global d_r, d_f, d_totals
+
+    # It is assumed that positions are in units where box = 1
+    # Forces are calculated in units where sigma = 1 and epsilon = 1
+    # Only the force evaluation is done on the GPU: positions are copied to the GPU,
+    # and forces are copied back, in each call
+
+    n, d = r.shape
+    assert d==3, 'Dimension error in force'
+
+    # The coordinates are handled as separate contiguous arrays of x, y and z components
+    # The forces are returned in the same layout, as an n*3 view of the component arrays
+    r_soa = np.ascontiguousarray ( r.T, dtype=np.float64 ) # The kernel works in double precision
+
+    if d_r is None or d_r.shape != r_soa.shape:
+        d_r      = cuda.device_array_like ( r_soa )
+        d_f      = cuda.device_array_like ( r_soa )
+        d_totals = cuda.device_array ( 5, dtype=np.float64 )
+
+    d_r.copy_to_device ( r_soa )
+    d_totals.copy_to_device ( np.zeros(5) )
+
+    force_kernel[n, threads] ( box, r_cut, d_r[0], d_r[1], d_r[2], d_f[0], d_f[1], d_f[2], d_totals )
+
+    f_soa  = d_f.copy_to_host()
+    totals = d_totals.copy_to_host()
+
+    # Multiply results by numerical factors, and correct for double-counting ij and ji
+    total = PotentialType ( cut = totals[0] * 4.0 / 2.0,        # 4*epsilon
+                            pot = totals[1] * 4.0 / 2.0,        # 4*epsilon
+                            vir = totals[2] * 24.0 / 3.0 / 2.0, # 24*epsilon and divide virial by 3
+                            lap = totals[3] * 24.0,             # 24*epsilon, ij and ji both included
+                            ovr = totals[4] > 0.5 )             # Count of overlapping pairs
+
+    return total, f_soa.T
+
+@cuda.jit ( fastmath=True )
+def force_kernel ( box, r_cut, rx, ry, rz, fx, fy, fz, totals ):
+    """GPU kernel: block i computes the force on atom i, its threads sharing the loop over j."""
+
+    # Each pair is visited twice, once from each atom, so only force on i is stored by each block
+    # Partial sums from each thread are reduced in shared memory; totals are accumulated atomically
+
+    i = cuda.blockIdx.x
+    t = cuda.threadIdx.x
+    n = rx.shape[0]
+
+    sr2_ovr      = 1.77 # Overlap threshold (pot > 100)
+    r_cut_box    = r_cut / box
+    r_cut_box_sq = r_cut_box ** 2
+    box_sq       = box ** 2
+
+    # Calculate potential at cutoff
+    sr2     = 1.0 / r_cut**2 # in sigma=1 units
+    sr6     = sr2 ** 3
+    pot_cut = sr6**2 - sr6   # Without numerical factor 4
+
+    # Partial sums of fx, fy, fz, cut, pot, vir, lap, ovr for each thread
+    sums = cuda.shared.array ( shape=(8,threads), dtype=float64 )
+    for k in range(8):
+        sums[k,t] = 0.0
+
+    for j in range(t, n, threads): # Inner loop, shared between threads
+        if j == i:
+            continue
+        rxij = rx[i] - rx[j]                    # Separation vector
+        ryij = ry[i] - ry[j]
+        rzij = rz[i] - rz[j]
+        rxij = rxij - math.floor ( rxij + 0.5 ) # Periodic boundary conditions in box=1 units
+        ryij = ryij - math.floor ( ryij + 0.5 )
+        rzij = rzij - math.floor ( rzij + 0.5 )
+        rij_sq = rxij**2 + ryij**2 + rzij**2    # Squared separation
+
+        if rij_sq < r_cut_box_sq: # Check within cutoff
+            sr2 = 1.0 / ( rij_sq * box_sq ) # (sigma/rij)**2 in sigma=1 units
+            if sr2 > sr2_ovr:               # Overlap if too close
+                sums[7,t] += 1.0
+
+            sr6   = sr2 ** 3
+            sr12  = sr6 ** 2
+            cutij = sr12 - sr6             # LJ pair potential (cut but not shifted)
+            virij = cutij + sr12           # LJ pair virial
+            fij   = virij * sr2            # LJ scalar part of forces
+            sums[0,t] += rxij * fij
+            sums[1,t] += ryij * fij
+            sums[2,t] += rzij * fij
+            sums[3,t] += cutij
+            sums[4,t] += cutij - pot_cut                 # LJ pair potential (cut-and-shifted)
+            sums[5,t] += virij
+            sums[6,t] += ( 22.0*sr12 - 5.0*sr6 ) * sr2   # LJ pair Laplacian
+
+    cuda.syncthreads()
+
+    # Tree reduction of the partial sums over threads
+    stride = threads // 2
+    while stride > 0:
+        if t < stride:
+            for k in range(8):
+                sums[k,t] += sums[k,t+stride]
+        cuda.syncthreads()
+        stride = stride // 2
+
+    if t == 0:
+        fx[i] = sums[0,0] * box * 24.0 # Now in sigma=1 units, and 24*epsilon
+        fy[i] = sums[1,0] * box * 24.0
+        fz[i] = sums[2,0] * box * 24.0
+        for k in range(5):
+            cuda.atomic.add ( totals, k, sums[k+3,0] )
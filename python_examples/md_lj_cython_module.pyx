@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# md_lj_cython_module.pyx
+
+#------------------------------------------------------------------------------------------------#
+# This software was written in 2016/17                                                           #
+# by Michael P. Allen <m.p.allen@warwick.ac.uk>/<m.p.allen@bristol.ac.uk>                        #
+# and Dominic J. Tildesley <d.tildesley7@gmail.com> ("the authors"),                             #
+# to accompany the book "Computer Simulation of Liquids", second edition, 2017 ("the text"),     #
+# published by Oxford University Press ("the publishers").                                       #
+#                                                                                                #
+# LICENCE                                                                                        #
+# Creative Commons CC0 Public Domain Dedication.                                                 #
+# To the extent possible under law, the authors have dedicated all copyright and related         #
+# and neighboring rights to this software to the PUBLIC domain worldwide.                        #
+# This software is distributed without any warranty.                                             #
+# You should have received a copy of the CC0 Public Domain Dedication along with this software.  #
+# If not, see <http://creativecommons.org/publicdomain/zero/1.0/>.                               #
+#                                                                                                #
+# DISCLAIMER                                                                                     #
+# The authors and publishers make no warranties about the software, and disclaim liability       #
+# for all uses of the software, to the fullest extent permitted by applicable law.               #
+# The authors and publishers do not recommend use of this software for any purpose.              #
+# It is made freely available, solely to clarify points made in the text. When using or citing   #
+# the software, you should not imply endorsement by the authors or publishers.                   #
+#------------------------------------------------------------------------------------------------#
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+
+"""Force routine for MD simulation, Lennard-Jones atoms, compiled with Cython and OpenMP."""
+
+# This module is compiled on first import by pyximport, using the options in md_lj_cython_module.pyxbld
+
+import numpy as np
+from cython.parallel import prange, threadid
+cimport openmp
+from libc.math cimport rint
+
+class PotentialType:
+    """A composite variable for interactions."""
+
+    __slots__ = ('cut','pot','vir','lap','ovr') # Fixed attributes, stored without an instance dictionary
+
+    def __init__(self, cut, pot, vir, lap, ovr):
+        self.cut = cut # the potential energy cut (but not shifted) at r_cut
+        self.pot = pot # the potential energy cut-and-shifted at r_cut
+        self.vir = vir # the virial
+        self.lap = lap # the Laplacian
+        self.ovr = ovr # a flag indicating overlap (i.e. pot too high to use)
+
+    def __add__(self, other):
+        cut = self.cut +  other.cut
+        pot = self.pot +  other.pot
+        vir = self.vir +  other.vir
+        lap = self.lap +  other.lap
+        ovr = self.ovr or other.ovr
+
+        return PotentialType(cut,pot,vir,lap,ovr)
+
+def introduction():
+    """Prints out introductory statements at start of run."""
+    
+    print('Lennard-Jones potential')
+    print('Cut-and-shifted version for dynamics')
+    print('Cut (but not shifted) version also calculated')
+    print('Diameter, sigma = 1')
+    print('Well depth, epsilon = 1')
+    print('Fast Cython force routine, parallelized with OpenMP')
+
+def conclusion():
+    """Prints out concluding statements at end of run."""
+
+    print('Program ends')
+
+def force ( box, r_cut, r ):
+    """Takes in box, cutoff range, and coordinate array, and calculates forces and potentials etc."""
+
+    # It is assumed that positions are in units where box = 1
+    # Forces are calculated in units where sigma = 1 and epsilon = 1
+
+    n, d = r.shape
+    assert d==3, 'Dimension error in force'
+
+    # The coordinates are handled as separate contiguous arrays of x, y and z components
+    # If r is already stored this way (Fortran order) no copy is made
+    # The forces are returned in the same layout, as an n*3 view of the component arrays
+    r_soa = np.ascontiguousarray ( r.T, dtype=np.float64 ) # The kernel works in double precision
+    f_soa = np.empty_like ( r_soa )
+
+    pot, vir, lap, cut, ovr = force_c ( box, r_cut, r_soa[0], r_soa[1], r_soa[2], f_soa[0], f_soa[1], f_soa[2] )
+
+    total = PotentialType ( cut=cut, pot=pot, vir=vir, lap=lap, ovr=ovr )
+
+    return total, f_soa.T
+
+cpdef tuple force_c ( double box, double r_cut,
+                      const double[::1] rx, const double[::1] ry, const double[::1] rz,
+                      double[::1] fx, double[::1] fy, double[::1] fz ):
+    """Compiled pair loop over coordinate arrays rx, ry, rz, storing forces in fx, fy, fz and returning totals."""
+
+    # Each pair i<j is visited once, and the force is added to i and subtracted from j (Newton's third law)
+    # Each thread handles a set of atoms i, adding forces on partners j into its own buffer, to avoid conflicts
+    # The buffers are summed at the end
+
+    cdef Py_ssize_t i, j, t, n = rx.shape[0]
+    cdef double rxi, ryi, rzi, rxij, ryij, rzij, rij_sq, sr2, sr6, sr12, cutij, virij, fij
+    cdef double fxi, fyi, fzi, fxij, fyij, fzij, cut_i, pot_i, vir_i, lap_i
+    cdef int    ovr_i, tid
+
+    cdef int    n_threads    = openmp.omp_get_max_threads()
+    cdef double[:,:,::1] f_t = np.zeros ( (n_threads,3,n), dtype=np.float64 ) # Per-thread force buffers
+
+    cdef double sr2_ovr      = 1.77 # Overlap threshold (pot > 100)
+    cdef double r_cut_box    = r_cut / box
+    cdef double r_cut_box_sq = r_cut_box ** 2
+    cdef double box_sq       = box ** 2
+
+    # Calculate potential at cutoff
+    cdef double sr2_cut = 1.0 / r_cut**2 # in sigma=1 units
+    cdef double sr6_cut = sr2_cut ** 3
+    cdef double pot_cut = sr6_cut**2 - sr6_cut # Without numerical factor 4
+
+    # Initialize
+    cdef double cut   = 0.0
+    cdef double pot   = 0.0
+    cdef double vir   = 0.0
+    cdef double lap   = 0.0
+    cdef int    n_ovr = 0
+
+    for i in prange(n-1, nogil=True, schedule='dynamic'): # Outer loop, shared between threads
+        tid   = threadid()
+        rxi   = rx[i]
+        ryi   = ry[i]
+        rzi   = rz[i]
+        fxi   = 0.0
+        fyi   = 0.0
+        fzi   = 0.0
+        cut_i = 0.0
+        pot_i = 0.0
+        vir_i = 0.0
+        lap_i = 0.0
+        ovr_i = 0
+
+        for j in range(i+1,n): # Inner loop over partner atoms
+            rxij = rxi - rx[j]            # Separation vector
+            ryij = ryi - ry[j]
+            rzij = rzi - rz[j]
+            rxij = rxij - rint ( rxij )   # Periodic boundary conditions in box=1 units
+            ryij = ryij - rint ( ryij )
+            rzij = rzij - rint ( rzij )
+            rij_sq = rxij*rxij + ryij*ryij + rzij*rzij # Squared separation
+
+            if rij_sq < r_cut_box_sq: # Check within cutoff
+                sr2 = 1.0 / ( rij_sq * box_sq ) # (sigma/rij)**2 in sigma=1 units
+                if sr2 > sr2_ovr:               # Overlap if too close
+                    ovr_i = ovr_i + 1
+
+                sr6   = sr2 * sr2 * sr2
+                sr12  = sr6 * sr6
+                cutij = sr12 - sr6             # LJ pair potential (cut but not shifted)
+                virij = cutij + sr12           # LJ pair virial
+                cut_i = cut_i + cutij
+                pot_i = pot_i + cutij - pot_cut                # LJ pair potential (cut-and-shifted)
+                vir_i = vir_i + virij
+                lap_i = lap_i + ( 22.0*sr12 - 5.0*sr6 ) * sr2  # LJ pair Laplacian
+                fij   = virij * sr2                            # LJ scalar part of forces
+                fxij  = rxij * fij
+                fyij  = ryij * fij
+                fzij  = rzij * fij
+                fxi   = fxi + fxij
+                fyi   = fyi + fyij
+                fzi   = fzi + fzij
+                f_t[tid,0,j] -= fxij
+                f_t[tid,1,j] -= fyij
+                f_t[tid,2,j] -= fzij
+
+        f_t[tid,0,i] += fxi
+        f_t[tid,1,i] += fyi
+        f_t[tid,2,i] += fzi
+        cut   += cut_i
+        pot   += pot_i
+        vir   += vir_i
+        lap   += lap_i
+        n_ovr += ovr_i
+
+    for i in prange(n, nogil=True, schedule='static'): # Sum the per-thread buffers
+        fxi = 0.0
+        fyi = 0.0
+        fzi = 0.0
+        for t in range(n_threads):
+            fxi = fxi + f_t[t,0,i]
+            fyi = fyi + f_t[t,1,i]
+            fzi = fzi + f_t[t,2,i]
+        fx[i] = fxi * box * 24.0 # Now in sigma=1 units, and 24*epsilon
+        fy[i] = fyi * box * 24.0
+        fz[i] = fzi * box * 24.0
+
+    # Multiply results by numerical factors
+    cut = cut * 4.0              # 4*epsilon
+    pot = pot * 4.0              # 4*epsilon
+    vir = vir * 24.0 / 3.0       # 24*epsilon and divide virial by 3
+    lap = lap * 24.0 * 2.0       # 24*epsilon and factor 2 for ij and ji
+
+    return pot, vir, lap, cut, n_ovr > 0
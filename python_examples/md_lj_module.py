@@ -31,6 +31,8 @@ fast = True # Change this to replace NumPy force evaluation with slower Python
 class PotentialType:
     """A composite variable for interactions."""
 
+    __slots__ = ('cut','pot','vir','lap','ovr') # Fixed attributes, stored without an instance dictionary
+
     def __init__(self, cut, pot, vir, lap, ovr):
         self.cut = cut # the potential energy cut (but not shifted) at r_cut
         self.pot = pot # the potential energy cut-and-shifted at r_cut
@@ -0,0 +1,520 @@
+/* md_lj_simd.c */
+
+/*------------------------------------------------------------------------------------------------
+ * This software was written in 2016/17
+ * by Michael P. Allen <m.p.allen@warwick.ac.uk>/<m.p.allen@bristol.ac.uk>
+ * and Dominic J. Tildesley <d.tildesley7@gmail.com> ("the authors"),
+ * to accompany the book "Computer Simulation of Liquids", second edition, 2017 ("the text"),
+ * published by Oxford University Press ("the publishers").
+ *
+ * LICENCE
+ * Creative Commons CC0 Public Domain Dedication.
+ * To the extent possible under law, the authors have dedicated all copyright and related
+ * and neighboring rights to this software to the PUBLIC domain worldwide.
+ * This software is distributed without any warranty.
+ * You should have received a copy of the CC0 Public Domain Dedication along with this software.
+ * If not, see <http://creativecommons.org/publicdomain/zero/1.0/>.
+ *
+ * DISCLAIMER
+ * The authors and publishers make no warranties about the software, and disclaim liability
+ * for all uses of the software, to the fullest extent permitted by applicable law.
+ * The authors and publishers do not recommend use of this software for any purpose.
+ * It is made freely available, solely to clarify points made in the text. When using or citing
+ * the software, you should not imply endorsement by the authors or publishers.
+ */
+
+/* Lennard-Jones pair forces, vectorized with AVX-512 or AVX2 intrinsics where available     */
+/* This file is included by md_lj_simd_module.pyx, which provides the Python interface       */
+/* Coordinates are supplied in box=1 units, as separate arrays of x, y and z components      */
+/* Forces are returned in sigma=1, epsilon=1 units in the same layout                        */
+/* totals[0..3] receive the cut, cut-and-shifted, virial and Laplacian sums; the result is   */
+/* nonzero if any pair overlaps                                                              */
+/* The atoms i are taken in tiles of W=8 (AVX-512) or W=4 (AVX2), one atom per vector lane,  */
+/* with positions and force sums held in registers; each j-atom is loaded once per tile, and */
+/* paired with all W atoms i at once; every tile is paired with all j, so that no two        */
+/* iterations of the outer loop write to the same force, and the outer loop may be shared    */
+/* between OpenMP threads; the force sums are stored directly, without reduction over lanes  */
+/* Unlike the Numba and Cython all-pairs routines, each pair is visited twice, ij and ji:    */
+/* with i<j, the force on each j would be the sum over the lanes of a tile, needing a        */
+/* horizontal reduction and a read-modify-write of f_j for every j, and per-thread buffers   */
+/* for f_j, which together cost more than the repeated pair terms they save                  */
+
+#include <math.h>
+
+#if defined(__AVX512F__) || (defined(__AVX2__) && defined(__FMA__))
+#include <immintrin.h>
+#endif
+
+#if defined(__AVX512F__)
+static const char simd_name[] = "AVX-512";
+#elif defined(__AVX2__) && defined(__FMA__)
+static const char simd_name[] = "AVX2";
+#else
+static const char simd_name[] = "scalar code (no AVX2 or AVX-512)";
+#endif
+
+static const double sr2_ovr = 1.77; /* Overlap threshold (pot > 100) */
+
+/* Accumulators for the pair loop over j, for a single atom i */
+typedef struct {
+    double fx, fy, fz, cut, pot, vir, lap;
+    int    ovr;
+} pair_sums;
+
+/* Scalar version of the pair loop for atom i, used for j in [j0,j1) */
+static void pair_loop_scalar ( int i, int j0, int j1, double r_cut_box_sq, double box_sq, double pot_cut,
+                               const double *rx, const double *ry, const double *rz, pair_sums *s )
+{
+    for ( int j = j0; j < j1; j++ ) {
+        if ( j == i ) continue;
+        double rxij = rx[i] - rx[j];              /* Separation vector */
+        double ryij = ry[i] - ry[j];
+        double rzij = rz[i] - rz[j];
+        rxij -= rint ( rxij );                    /* Periodic boundary conditions in box=1 units */
+        ryij -= rint ( ryij );
+        rzij -= rint ( rzij );
+        double rij_sq = rxij*rxij + ryij*ryij + rzij*rzij;
+
+        if ( rij_sq < r_cut_box_sq ) {            /* Check within cutoff */
+            double sr2  = 1.0 / ( rij_sq * box_sq );
+            double sr6  = sr2 * sr2 * sr2;
+            double sr12 = sr6 * sr6;
+            double cut  = sr12 - sr6;             /* LJ pair potential (cut but not shifted) */
+            double vir  = cut + sr12;             /* LJ pair virial */
+            double fij  = vir * sr2;              /* LJ scalar part of forces */
+            if ( sr2 > sr2_ovr ) s->ovr++;        /* Overlap if too close */
+            s->cut += cut;
+            s->pot += cut - pot_cut;              /* LJ pair potential (cut-and-shifted) */
+            s->vir += vir;
+            s->lap += ( 22.0*sr12 - 5.0*sr6 ) * sr2; /* LJ pair Laplacian */
+            s->fx  += rxij * fij;
+            s->fy  += ryij * fij;
+            s->fz  += rzij * fij;
+        }
+    }
+}
+
+int lj_force_simd ( int n, double box, double r_cut,
+                    const double *rx, const double *ry, const double *rz,
+                    double *fx, double *fy, double *fz, double *totals )
+{
+    const double r_cut_box    = r_cut / box;
+    const double r_cut_box_sq = r_cut_box * r_cut_box;
+    const double box_sq       = box * box;
+
+    /* Calculate potential at cutoff */
+    const double sr2_cut = 1.0 / ( r_cut * r_cut ); /* in sigma=1 units */
+    const double sr6_cut = sr2_cut * sr2_cut * sr2_cut;
+    const double pot_cut = sr6_cut * sr6_cut - sr6_cut; /* Without numerical factor 4 */
+
+    double cut = 0.0, pot = 0.0, vir = 0.0, lap = 0.0;
+    int    n_ovr = 0;
+    int    i_end = 0; /* Start of remaining i-atoms handled by scalar loop */
+
+#if defined(__AVX512F__)
+
+    i_end = n; /* The last tile is masked */
+
+#pragma omp parallel for schedule(dynamic) reduction(+:cut,pot,vir,lap,n_ovr)
+    for ( int i0 = 0; i0 < n; i0 += 8 ) { /* Outer loop over tiles, shared between threads if compiled with OpenMP */
+        const __mmask8 mi = ( n-i0 >= 8 ) ? (__mmask8) 0xFF : (__mmask8) ( ( 1u << (n-i0) ) - 1u );
+
+        const __m512d rxi = _mm512_maskz_loadu_pd ( mi, rx+i0 ); /* Positions of the tile of i-atoms */
+        const __m512d ryi = _mm512_maskz_loadu_pd ( mi, ry+i0 );
+        const __m512d rzi = _mm512_maskz_loadu_pd ( mi, rz+i0 );
+        const __m512d rc2 = _mm512_set1_pd ( r_cut_box_sq );
+        const __m512d bx2 = _mm512_set1_pd ( box_sq );
+        const __m512d two = _mm512_set1_pd ( 2.0 );
+        const __m512d ovr = _mm512_set1_pd ( sr2_ovr );
+        const __m512d pcv = _mm512_set1_pd ( pot_cut );
+        const __m512d c22 = _mm512_set1_pd ( 22.0 );
+        const __m512d c5  = _mm512_set1_pd ( 5.0 );
+        const __m512d f24 = _mm512_set1_pd ( box * 24.0 );
+        __m512d sfx = _mm512_setzero_pd ( ), sfy = _mm512_setzero_pd ( ), sfz = _mm512_setzero_pd ( );
+        __m512d scut = _mm512_setzero_pd ( ), spot = _mm512_setzero_pd ( );
+        __m512d svir = _mm512_setzero_pd ( ), slap = _mm512_setzero_pd ( );
+        int     s_ovr = 0;
+
+        for ( int j = 0; j < n; j++ ) { /* Inner loop over all j-atoms, each paired with the whole tile */
+            __mmask8 m = mi;
+            if ( j >= i0 && j < i0+8 ) m &= (__mmask8) ~( 1u << (j-i0) ); /* Exclude i==j */
+
+            __m512d rxij = _mm512_sub_pd ( rxi, _mm512_set1_pd ( rx[j] ) ); /* Separation vectors */
+            __m512d ryij = _mm512_sub_pd ( ryi, _mm512_set1_pd ( ry[j] ) );
+            __m512d rzij = _mm512_sub_pd ( rzi, _mm512_set1_pd ( rz[j] ) );
+            rxij = _mm512_sub_pd ( rxij, _mm512_roundscale_pd ( rxij, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC ) );
+            ryij = _mm512_sub_pd ( ryij, _mm512_roundscale_pd ( ryij, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC ) );
+            rzij = _mm512_sub_pd ( rzij, _mm512_roundscale_pd ( rzij, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC ) );
+            __m512d rij_sq = _mm512_mul_pd ( rxij, rxij );
+            rij_sq = _mm512_fmadd_pd ( ryij, ryij, rij_sq );
+            rij_sq = _mm512_fmadd_pd ( rzij, rzij, rij_sq );
+
+            __mmask8 in_range = _mm512_mask_cmp_pd_mask ( m, rij_sq, rc2, _CMP_LT_OQ ); /* Check within cutoff */
+            if ( !in_range ) continue;
+
+            /* sr2 = 1/(rij_sq*box_sq) from the approximate reciprocal, refined by two Newton-Raphson steps */
+            __m512d x   = _mm512_mul_pd ( rij_sq, bx2 );
+            __m512d sr2 = _mm512_rcp14_pd ( x );
+            sr2 = _mm512_mul_pd ( sr2, _mm512_fnmadd_pd ( x, sr2, two ) );
+            sr2 = _mm512_mul_pd ( sr2, _mm512_fnmadd_pd ( x, sr2, two ) );
+            sr2 = _mm512_maskz_mov_pd ( in_range, sr2 ); /* Zero outside cutoff */
+
+            s_ovr += __builtin_popcount ( (unsigned) _mm512_cmp_pd_mask ( sr2, ovr, _CMP_GT_OQ ) );
+
+            __m512d sr6  = _mm512_mul_pd ( _mm512_mul_pd ( sr2, sr2 ), sr2 );
+            __m512d sr12 = _mm512_mul_pd ( sr6, sr6 );
+            __m512d cutv = _mm512_sub_pd ( sr12, sr6 ); /* LJ pair potential (cut but not shifted) */
+            __m512d virv = _mm512_add_pd ( cutv, sr12 ); /* LJ pair virial */
+            __m512d fij  = _mm512_mul_pd ( virv, sr2 ); /* LJ scalar part of forces */
+            scut = _mm512_add_pd ( scut, cutv );
+            spot = _mm512_mask_add_pd ( spot, in_range, spot, _mm512_sub_pd ( cutv, pcv ) );
+            svir = _mm512_add_pd ( svir, virv );
+            slap = _mm512_fmadd_pd ( _mm512_fmsub_pd ( c22, sr12, _mm512_mul_pd ( c5, sr6 ) ), sr2, slap );
+            sfx  = _mm512_fmadd_pd ( rxij, fij, sfx );
+            sfy  = _mm512_fmadd_pd ( ryij, fij, sfy );
+            sfz  = _mm512_fmadd_pd ( rzij, fij, sfz );
+        }
+
+        _mm512_mask_storeu_pd ( fx+i0, mi, _mm512_mul_pd ( sfx, f24 ) ); /* Now in sigma=1 units, and 24*epsilon */
+        _mm512_mask_storeu_pd ( fy+i0, mi, _mm512_mul_pd ( sfy, f24 ) );
+        _mm512_mask_storeu_pd ( fz+i0, mi, _mm512_mul_pd ( sfz, f24 ) );
+        cut   += _mm512_reduce_add_pd ( scut );
+        pot   += _mm512_reduce_add_pd ( spot );
+        vir   += _mm512_reduce_add_pd ( svir );
+        lap   += _mm512_reduce_add_pd ( slap );
+        n_ovr += s_ovr;
+    }
+
+#elif defined(__AVX2__) && defined(__FMA__)
+
+    i_end = n - n%4;
+
+#pragma omp parallel for schedule(dynamic) reduction(+:cut,pot,vir,lap,n_ovr)
+    for ( int i0 = 0; i0 < i_end; i0 += 4 ) { /* Outer loop over tiles, shared between threads if compiled with OpenMP */
+        const __m256d rxi  = _mm256_loadu_pd ( rx+i0 ); /* Positions of the tile of i-atoms */
+        const __m256d ryi  = _mm256_loadu_pd ( ry+i0 );
+        const __m256d rzi  = _mm256_loadu_pd ( rz+i0 );
+        const __m256d rc2  = _mm256_set1_pd ( r_cut_box_sq );
+        const __m256d bx2  = _mm256_set1_pd ( box_sq );
+        const __m256d one  = _mm256_set1_pd ( 1.0 );
+        const __m256d ovr  = _mm256_set1_pd ( sr2_ovr );
+        const __m256d pcv  = _mm256_set1_pd ( pot_cut );
+        const __m256d c22  = _mm256_set1_pd ( 22.0 );
+        const __m256d c5   = _mm256_set1_pd ( 5.0 );
+        const __m256d f24  = _mm256_set1_pd ( box * 24.0 );
+        const __m256d ivec = _mm256_add_pd ( _mm256_set1_pd ( (double) i0 ), _mm256_set_pd ( 3.0, 2.0, 1.0, 0.0 ) );
+        __m256d sfx = _mm256_setzero_pd ( ), sfy = _mm256_setzero_pd ( ), sfz = _mm256_setzero_pd ( );
+        __m256d scut = _mm256_setzero_pd ( ), spot = _mm256_setzero_pd ( );
+        __m256d svir = _mm256_setzero_pd ( ), slap = _mm256_setzero_pd ( );
+        int     s_ovr = 0;
+        double  buf[4];
+
+        for ( int j = 0; j < n; j++ ) { /* Inner loop over all j-atoms, each paired with the whole tile */
+            __m256d rxij = _mm256_sub_pd ( rxi, _mm256_set1_pd ( rx[j] ) ); /* Separation vectors */
+            __m256d ryij = _mm256_sub_pd ( ryi, _mm256_set1_pd ( ry[j] ) );
+            __m256d rzij = _mm256_sub_pd ( rzi, _mm256_set1_pd ( rz[j] ) );
+            rxij = _mm256_sub_pd ( rxij, _mm256_round_pd ( rxij, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC ) );
+            ryij = _mm256_sub_pd ( ryij, _mm256_round_pd ( ryij, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC ) );
+            rzij = _mm256_sub_pd ( rzij, _mm256_round_pd ( rzij, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC ) );
+            __m256d rij_sq = _mm256_mul_pd ( rxij, rxij );
+            rij_sq = _mm256_fmadd_pd ( ryij, ryij, rij_sq );
+            rij_sq = _mm256_fmadd_pd ( rzij, rzij, rij_sq );
+
+            __m256d in_range = _mm256_cmp_pd ( rij_sq, rc2, _CMP_LT_OQ ); /* Check within cutoff, excluding i==j */
+            in_range = _mm256_and_pd ( in_range, _mm256_cmp_pd ( ivec, _mm256_set1_pd ( (double) j ), _CMP_NEQ_OQ ) );
+            if ( _mm256_testz_pd ( in_range, in_range ) ) continue;
+
+            /* AVX2 has no double-precision reciprocal approximation, so divide */
+            __m256d sr2 = _mm256_div_pd ( one, _mm256_mul_pd ( rij_sq, bx2 ) );
+            sr2 = _mm256_and_pd ( in_range, sr2 ); /* Zero outside cutoff */
+
+            s_ovr += __builtin_popcount ( (unsigned) _mm256_movemask_pd ( _mm256_cmp_pd ( sr2, ovr, _CMP_GT_OQ ) ) );
+
+            __m256d sr6  = _mm256_mul_pd ( _mm256_mul_pd ( sr2, sr2 ), sr2 );
+            __m256d sr12 = _mm256_mul_pd ( sr6, sr6 );
+            __m256d cutv = _mm256_sub_pd ( sr12, sr6 ); /* LJ pair potential (cut but not shifted) */
+            __m256d virv = _mm256_add_pd ( cutv, sr12 ); /* LJ pair virial */
+            __m256d fij  = _mm256_mul_pd ( virv, sr2 ); /* LJ scalar part of forces */
+            scut = _mm256_add_pd ( scut, cutv );
+            spot = _mm256_add_pd ( spot, _mm256_and_pd ( in_range, _mm256_sub_pd ( cutv, pcv ) ) );
+            svir = _mm256_add_pd ( svir, virv );
+            slap = _mm256_fmadd_pd ( _mm256_fmsub_pd ( c22, sr12, _mm256_mul_pd ( c5, sr6 ) ), sr2, slap );
+            sfx  = _mm256_fmadd_pd ( rxij, fij, sfx );
+            sfy  = _mm256_fmadd_pd ( ryij, fij, sfy );
+            sfz  = _mm256_fmadd_pd ( rzij, fij, sfz );
+        }
+
+        _mm256_storeu_pd ( fx+i0, _mm256_mul_pd ( sfx, f24 ) ); /* Now in sigma=1 units, and 24*epsilon */
+        _mm256_storeu_pd ( fy+i0, _mm256_mul_pd ( sfy, f24 ) );
+        _mm256_storeu_pd ( fz+i0, _mm256_mul_pd ( sfz, f24 ) );
+        _mm256_storeu_pd ( buf, scut ); cut += buf[0] + buf[1] + buf[2] + buf[3];
+        _mm256_storeu_pd ( buf, spot ); pot += buf[0] + buf[1] + buf[2] + buf[3];
+        _mm256_storeu_pd ( buf, svir ); vir += buf[0] + buf[1] + buf[2] + buf[3];
+        _mm256_storeu_pd ( buf, slap ); lap += buf[0] + buf[1] + buf[2] + buf[3];
+        n_ovr += s_ovr;
+    }
+
+#endif
+
+    /* Remaining i-atoms, or all of them if no vector instructions are available */
+#pragma omp parallel for schedule(dynamic) reduction(+:cut,pot,vir,lap,n_ovr)
+    for ( int i = i_end; i < n; i++ ) {
+        pair_sums s = { 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0 };
+
+        pair_loop_scalar ( i, 0, n, r_cut_box_sq, box_sq, pot_cut, rx, ry, rz, &s );
+
+        fx[i] = s.fx * box * 24.0; /* Now in sigma=1 units, and 24*epsilon */
+        fy[i] = s.fy * box * 24.0;
+        fz[i] = s.fz * box * 24.0;
+        cut   += s.cut;
+        pot   += s.pot;
+        vir   += s.vir;
+        lap   += s.lap;
+        n_ovr += s.ovr;
+    }
+
+    /* Multiply results by numerical factors, and correct for double-counting ij and ji */
+    totals[0] = cut * 4.0 / 2.0;        /* 4*epsilon */
+    totals[1] = pot * 4.0 / 2.0;        /* 4*epsilon */
+    totals[2] = vir * 24.0 / 3.0 / 2.0; /* 24*epsilon and divide virial by 3 */
+    totals[3] = lap * 24.0;             /* 24*epsilon, ij and ji both included */
+
+    return n_ovr > 0;
+}
+
+/* Single-precision version of the above, for coordinates and forces stored as float           */
+/* Pair terms, and sums over j for each atom i, are computed in single precision, giving twice */
+/* as many lanes per vector, and tiles of twice as many i-atoms; the sums over i of the cut,   */
+/* cut-and-shifted, virial and Laplacian terms are accumulated in double precision             */
+
+/* Accumulators for the pair loop over j, for a single atom i */
+typedef struct {
+    float fx, fy, fz, cut, pot, vir, lap;
+    int   ovr;
+} pair_sums_sp;
+
+/* Scalar version of the pair loop for atom i, used for j in [j0,j1) */
+static void pair_loop_scalar_sp ( int i, int j0, int j1, float r_cut_box_sq, float box_sq, float pot_cut,
+                                  const float *rx, const float *ry, const float *rz, pair_sums_sp *s )
+{
+    for ( int j = j0; j < j1; j++ ) {
+        if ( j == i ) continue;
+        float rxij = rx[i] - rx[j];               /* Separation vector */
+        float ryij = ry[i] - ry[j];
+        float rzij = rz[i] - rz[j];
+        rxij -= rintf ( rxij );                   /* Periodic boundary conditions in box=1 units */
+        ryij -= rintf ( ryij );
+        rzij -= rintf ( rzij );
+        float rij_sq = rxij*rxij + ryij*ryij + rzij*rzij;
+
+        if ( rij_sq < r_cut_box_sq ) {            /* Check within cutoff */
+            float sr2  = 1.0f / ( rij_sq * box_sq );
+            float sr6  = sr2 * sr2 * sr2;
+            float sr12 = sr6 * sr6;
+            float cut  = sr12 - sr6;              /* LJ pair potential (cut but not shifted) */
+            float vir  = cut + sr12;              /* LJ pair virial */
+            float fij  = vir * sr2;               /* LJ scalar part of forces */
+            if ( sr2 > (float) sr2_ovr ) s->ovr++; /* Overlap if too close */
+            s->cut += cut;
+            s->pot += cut - pot_cut;              /* LJ pair potential (cut-and-shifted) */
+            s->vir += vir;
+            s->lap += ( 22.0f*sr12 - 5.0f*sr6 ) * sr2; /* LJ pair Laplacian */
+            s->fx  += rxij * fij;
+            s->fy  += ryij * fij;
+            s->fz  += rzij * fij;
+        }
+    }
+}
+
+int lj_force_simd_sp ( int n, double box, double r_cut,
+                       const float *rx, const float *ry, const float *rz,
+                       float *fx, float *fy, float *fz, double *totals )
+{
+    const float r_cut_box    = (float) ( r_cut / box );
+    const float r_cut_box_sq = r_cut_box * r_cut_box;
+    const float box_sq       = (float) ( box * box );
+
+    /* Calculate potential at cutoff */
+    const double sr2_cut = 1.0 / ( r_cut * r_cut ); /* in sigma=1 units */
+    const double sr6_cut = sr2_cut * sr2_cut * sr2_cut;
+    const float  pot_cut = (float) ( sr6_cut * sr6_cut - sr6_cut ); /* Without numerical factor 4 */
+
+    double cut = 0.0, pot = 0.0, vir = 0.0, lap = 0.0;
+    int    n_ovr = 0;
+    int    i_end = 0; /* Start of remaining i-atoms handled by scalar loop */
+
+#if defined(__AVX512F__)
+
+    i_end = n; /* The last tile is masked */
+
+#pragma omp parallel for schedule(dynamic) reduction(+:cut,pot,vir,lap,n_ovr)
+    for ( int i0 = 0; i0 < n; i0 += 16 ) { /* Outer loop over tiles, shared between threads if compiled with OpenMP */
+        const __mmask16 mi = ( n-i0 >= 16 ) ? (__mmask16) 0xFFFF : (__mmask16) ( ( 1u << (n-i0) ) - 1u );
+
+        const __m512 rxi = _mm512_maskz_loadu_ps ( mi, rx+i0 ); /* Positions of the tile of i-atoms */
+        const __m512 ryi = _mm512_maskz_loadu_ps ( mi, ry+i0 );
+        const __m512 rzi = _mm512_maskz_loadu_ps ( mi, rz+i0 );
+        const __m512 rc2 = _mm512_set1_ps ( r_cut_box_sq );
+        const __m512 bx2 = _mm512_set1_ps ( box_sq );
+        const __m512 two = _mm512_set1_ps ( 2.0f );
+        const __m512 ovr = _mm512_set1_ps ( (float) sr2_ovr );
+        const __m512 pcv = _mm512_set1_ps ( pot_cut );
+        const __m512 c22 = _mm512_set1_ps ( 22.0f );
+        const __m512 c5  = _mm512_set1_ps ( 5.0f );
+        const __m512 f24 = _mm512_set1_ps ( (float) ( box * 24.0 ) );
+        __m512 sfx = _mm512_setzero_ps ( ), sfy = _mm512_setzero_ps ( ), sfz = _mm512_setzero_ps ( );
+        __m512 scut = _mm512_setzero_ps ( ), spot = _mm512_setzero_ps ( );
+        __m512 svir = _mm512_setzero_ps ( ), slap = _mm512_setzero_ps ( );
+        int    s_ovr = 0;
+
+        for ( int j = 0; j < n; j++ ) { /* Inner loop over all j-atoms, each paired with the whole tile */
+            __mmask16 m = mi;
+            if ( j >= i0 && j < i0+16 ) m &= (__mmask16) ~( 1u << (j-i0) ); /* Exclude i==j */
+
+            __m512 rxij = _mm512_sub_ps ( rxi, _mm512_set1_ps ( rx[j] ) ); /* Separation vectors */
+            __m512 ryij = _mm512_sub_ps ( ryi, _mm512_set1_ps ( ry[j] ) );
+            __m512 rzij = _mm512_sub_ps ( rzi, _mm512_set1_ps ( rz[j] ) );
+            rxij = _mm512_sub_ps ( rxij, _mm512_roundscale_ps ( rxij, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC ) );
+            ryij = _mm512_sub_ps ( ryij, _mm512_roundscale_ps ( ryij, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC ) );
+            rzij = _mm512_sub_ps ( rzij, _mm512_roundscale_ps ( rzij, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC ) );
+            __m512 rij_sq = _mm512_mul_ps ( rxij, rxij );
+            rij_sq = _mm512_fmadd_ps ( ryij, ryij, rij_sq );
+            rij_sq = _mm512_fmadd_ps ( rzij, rzij, rij_sq );
+
+            __mmask16 in_range = _mm512_mask_cmp_ps_mask ( m, rij_sq, rc2, _CMP_LT_OQ ); /* Check within cutoff */
+            if ( !in_range ) continue;
+
+            /* sr2 = 1/(rij_sq*box_sq) from the approximate reciprocal, refined by one Newton-Raphson step */
+            __m512 x   = _mm512_mul_ps ( rij_sq, bx2 );
+            __m512 sr2 = _mm512_rcp14_ps ( x );
+            sr2 = _mm512_mul_ps ( sr2, _mm512_fnmadd_ps ( x, sr2, two ) );
+            sr2 = _mm512_maskz_mov_ps ( in_range, sr2 ); /* Zero outside cutoff */
+
+            s_ovr += __builtin_popcount ( (unsigned) _mm512_cmp_ps_mask ( sr2, ovr, _CMP_GT_OQ ) );
+
+            __m512 sr6  = _mm512_mul_ps ( _mm512_mul_ps ( sr2, sr2 ), sr2 );
+            __m512 sr12 = _mm512_mul_ps ( sr6, sr6 );
+            __m512 cutv = _mm512_sub_ps ( sr12, sr6 ); /* LJ pair potential (cut but not shifted) */
+            __m512 virv = _mm512_add_ps ( cutv, sr12 ); /* LJ pair virial */
+            __m512 fij  = _mm512_mul_ps ( virv, sr2 ); /* LJ scalar part of forces */
+            scut = _mm512_add_ps ( scut, cutv );
+            spot = _mm512_mask_add_ps ( spot, in_range, spot, _mm512_sub_ps ( cutv, pcv ) );
+            svir = _mm512_add_ps ( svir, virv );
+            slap = _mm512_fmadd_ps ( _mm512_fmsub_ps ( c22, sr12, _mm512_mul_ps ( c5, sr6 ) ), sr2, slap );
+            sfx  = _mm512_fmadd_ps ( rxij, fij, sfx );
+            sfy  = _mm512_fmadd_ps ( ryij, fij, sfy );
+            sfz  = _mm512_fmadd_ps ( rzij, fij, sfz );
+        }
+
+        _mm512_mask_storeu_ps ( fx+i0, mi, _mm512_mul_ps ( sfx, f24 ) ); /* Now in sigma=1 units, and 24*epsilon */
+        _mm512_mask_storeu_ps ( fy+i0, mi, _mm512_mul_ps ( sfy, f24 ) );
+        _mm512_mask_storeu_ps ( fz+i0, mi, _mm512_mul_ps ( sfz, f24 ) );
+        cut   += (double) _mm512_reduce_add_ps ( scut );
+        pot   += (double) _mm512_reduce_add_ps ( spot );
+        vir   += (double) _mm512_reduce_add_ps ( svir );
+        lap   += (double) _mm512_reduce_add_ps ( slap );
+        n_ovr += s_ovr;
+    }
+
+#elif defined(__AVX2__) && defined(__FMA__)
+
+    i_end = n - n%8;
+
+#pragma omp parallel for schedule(dynamic) reduction(+:cut,pot,vir,lap,n_ovr)
+    for ( int i0 = 0; i0 < i_end; i0 += 8 ) { /* Outer loop over tiles, shared between threads if compiled with OpenMP */
+        const __m256 rxi  = _mm256_loadu_ps ( rx+i0 ); /* Positions of the tile of i-atoms */
+        const __m256 ryi  = _mm256_loadu_ps ( ry+i0 );
+        const __m256 rzi  = _mm256_loadu_ps ( rz+i0 );
+        const __m256 rc2  = _mm256_set1_ps ( r_cut_box_sq );
+        const __m256 bx2  = _mm256_set1_ps ( box_sq );
+        const __m256 two  = _mm256_set1_ps ( 2.0f );
+        const __m256 ovr  = _mm256_set1_ps ( (float) sr2_ovr );
+        const __m256 pcv  = _mm256_set1_ps ( pot_cut );
+        const __m256 c22  = _mm256_set1_ps ( 22.0f );
+        const __m256 c5   = _mm256_set1_ps ( 5.0f );
+        const __m256 f24  = _mm256_set1_ps ( (float) ( box * 24.0 ) );
+        const __m256 ivec = _mm256_add_ps ( _mm256_set1_ps ( (float) i0 ),
+                                            _mm256_set_ps ( 7.0f, 6.0f, 5.0f, 4.0f, 3.0f, 2.0f, 1.0f, 0.0f ) );
+        __m256 sfx = _mm256_setzero_ps ( ), sfy = _mm256_setzero_ps ( ), sfz = _mm256_setzero_ps ( );
+        __m256 scut = _mm256_setzero_ps ( ), spot = _mm256_setzero_ps ( );
+        __m256 svir = _mm256_setzero_ps ( ), slap = _mm256_setzero_ps ( );
+        int    s_ovr = 0;
+        float  buf[8];
+
+        for ( int j = 0; j < n; j++ ) { /* Inner loop over all j-atoms, each paired with the whole tile */
+            __m256 rxij = _mm256_sub_ps ( rxi, _mm256_set1_ps ( rx[j] ) ); /* Separation vectors */
+            __m256 ryij = _mm256_sub_ps ( ryi, _mm256_set1_ps ( ry[j] ) );
+            __m256 rzij = _mm256_sub_ps ( rzi, _mm256_set1_ps ( rz[j] ) );
+            rxij = _mm256_sub_ps ( rxij, _mm256_round_ps ( rxij, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC ) );
+            ryij = _mm256_sub_ps ( ryij, _mm256_round_ps ( ryij, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC ) );
+            rzij = _mm256_sub_ps ( rzij, _mm256_round_ps ( rzij, _MM_FROUND_TO_NEAREST_INT | _MM_FROUND_NO_EXC ) );
+            __m256 rij_sq = _mm256_mul_ps ( rxij, rxij );
+            rij_sq = _mm256_fmadd_ps ( ryij, ryij, rij_sq );
+            rij_sq = _mm256_fmadd_ps ( rzij, rzij, rij_sq );
+
+            __m256 in_range = _mm256_cmp_ps ( rij_sq, rc2, _CMP_LT_OQ ); /* Check within cutoff, excluding i==j */
+            in_range = _mm256_and_ps ( in_range, _mm256_cmp_ps ( ivec, _mm256_set1_ps ( (float) j ), _CMP_NEQ_OQ ) );
+            if ( _mm256_testz_ps ( in_range, in_range ) ) continue;
+
+            /* sr2 = 1/(rij_sq*box_sq) from the approximate reciprocal, refined by one Newton-Raphson step */
+            __m256 x   = _mm256_mul_ps ( rij_sq, bx2 );
+            __m256 sr2 = _mm256_rcp_ps ( x );
+            sr2 = _mm256_mul_ps ( sr2, _mm256_fnmadd_ps ( x, sr2, two ) );
+            sr2 = _mm256_and_ps ( in_range, sr2 ); /* Zero outside cutoff */
+
+            s_ovr += __builtin_popcount ( (unsigned) _mm256_movemask_ps ( _mm256_cmp_ps ( sr2, ovr, _CMP_GT_OQ ) ) );
+
+            __m256 sr6  = _mm256_mul_ps ( _mm256_mul_ps ( sr2, sr2 ), sr2 );
+            __m256 sr12 = _mm256_mul_ps ( sr6, sr6 );
+            __m256 cutv = _mm256_sub_ps ( sr12, sr6 ); /* LJ pair potential (cut but not shifted) */
+            __m256 virv = _mm256_add_ps ( cutv, sr12 ); /* LJ pair virial */
+            __m256 fij  = _mm256_mul_ps ( virv, sr2 ); /* LJ scalar part of forces */
+            scut = _mm256_add_ps ( scut, cutv );
+            spot = _mm256_add_ps ( spot, _mm256_and_ps ( in_range, _mm256_sub_ps ( cutv, pcv ) ) );
+            svir = _mm256_add_ps ( svir, virv );
+            slap = _mm256_fmadd_ps ( _mm256_fmsub_ps ( c22, sr12, _mm256_mul_ps ( c5, sr6 ) ), sr2, slap );
+            sfx  = _mm256_fmadd_ps ( rxij, fij, sfx );
+            sfy  = _mm256_fmadd_ps ( ryij, fij, sfy );
+            sfz  = _mm256_fmadd_ps ( rzij, fij, sfz );
+        }
+
+        _mm256_storeu_ps ( fx+i0, _mm256_mul_ps ( sfx, f24 ) ); /* Now in sigma=1 units, and 24*epsilon */
+        _mm256_storeu_ps ( fy+i0, _mm256_mul_ps ( sfy, f24 ) );
+        _mm256_storeu_ps ( fz+i0, _mm256_mul_ps ( sfz, f24 ) );
+
+#define SUM8(v) ( _mm256_storeu_ps ( buf, v ), buf[0]+buf[1]+buf[2]+buf[3]+buf[4]+buf[5]+buf[6]+buf[7] )
+        cut   += (double) SUM8 ( scut );
+        pot   += (double) SUM8 ( spot );
+        vir   += (double) SUM8 ( svir );
+        lap   += (double) SUM8 ( slap );
+#undef SUM8
+        n_ovr += s_ovr;
+    }
+
+#endif
+
+    /* Remaining i-atoms, or all of them if no vector instructions are available */
+#pragma omp parallel for schedule(dynamic) reduction(+:cut,pot,vir,lap,n_ovr)
+    for ( int i = i_end; i < n; i++ ) {
+        pair_sums_sp s = { 0.0f, 0.0f, 0.0f, 0.0f, 0.0f, 0.0f, 0.0f, 0 };
+
+        pair_loop_scalar_sp ( i, 0, n, r_cut_box_sq, box_sq, pot_cut, rx, ry, rz, &s );
+
+        fx[i] = s.fx * (float) ( box * 24.0 ); /* Now in sigma=1 units, and 24*epsilon */
+        fy[i] = s.fy * (float) ( box * 24.0 );
+        fz[i] = s.fz * (float) ( box * 24.0 );
+        cut   += (double) s.cut;
+        pot   += (double) s.pot;
+        vir   += (double) s.vir;
+        lap   += (double) s.lap;
+        n_ovr += s.ovr;
+    }
+
+    /* Multiply results by numerical factors, and correct for double-counting ij and ji */
+    totals[0] = cut * 4.0 / 2.0;        /* 4*epsilon */
+    totals[1] = pot * 4.0 / 2.0;        /* 4*epsilon */
+    totals[2] = vir * 24.0 / 3.0 / 2.0; /* 24*epsilon and divide virial by 3 */
+    totals[3] = lap * 24.0;             /* 24*epsilon, ij and ji both included */
+
+    return n_ovr > 0;
+}
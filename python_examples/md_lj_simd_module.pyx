@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# md_lj_simd_module.pyx
+
+#------------------------------------------------------------------------------------------------#
+# This software was written in 2016/17                                                           #
+# by Michael P. Allen <m.p.allen@warwick.ac.uk>/<m.p.allen@bristol.ac.uk>                        #
+# and Dominic J. Tildesley <d.tildesley7@gmail.com> ("the authors"),                             #
+# to accompany the book "Computer Simulation of Liquids", second edition, 2017 ("the text"),     #
+# published by Oxford University Press ("the publishers").                                       #
+#                                                                                                #
+# LICENCE                                                                                        #
+# Creative Commons CC0 Public Domain Dedication.                                                 #
+# To the extent possible under law, the authors have dedicated all copyright and related         #
+# and neighboring rights to this software to the PUBLIC domain worldwide.                        #
+# This software is distributed without any warranty.                                             #
+# You should have received a copy of the CC0 Public Domain Dedication along with this software.  #
+# If not, see <http://creativecommons.org/publicdomain/zero/1.0/>.                               #
+#                                                                                                #
+# DISCLAIMER                                                                                     #
+# The authors and publishers make no warranties about the software, and disclaim liability       #
+# for all uses of the software, to the fullest extent permitted by applicable law.               #
+# The authors and publishers do not recommend use of this software for any purpose.              #
+# It is made freely available, solely to clarify points made in the text. When using or citing   #
+# the software, you should not imply endorsement by the authors or publishers.                   #
+#------------------------------------------------------------------------------------------------#
+# cython: language_level=3
+
+"""Force routine for MD simulation, Lennard-Jones atoms, vectorized in C with AVX-512 or AVX2 intrinsics and OpenMP."""
+
+# This module is compiled on first import by pyximport, using the options in md_lj_simd_module.pyxbld
+# The force kernel itself is in the C file md_lj_simd.c
+
+import numpy as np
+cimport cython
+from libc.math cimport rint
+
+ctypedef fused real_t: # Coordinates, velocities and forces are stored in single or double precision
+    float
+    double
+
+cdef extern from "md_lj_simd.c":
+    const char *simd_name
+    int lj_force_simd ( int n, double box, double r_cut,
+                        const double *rx, const double *ry, const double *rz,
+                        double *fx, double *fy, double *fz, double *totals ) nogil
+    int lj_force_simd_sp ( int n, double box, double r_cut,
+                           const float *rx, const float *ry, const float *rz,
+                           float *fx, float *fy, float *fz, double *totals ) nogil
+
+class PotentialType:
+    """A composite variable for interactions."""
+
+    __slots__ = ('cut','pot','vir','lap','ovr') # Fixed attributes, stored without an instance dictionary
+
+    def __init__(self, cut, pot, vir, lap, ovr):
+        self.cut = cut # the potential energy cut (but not shifted) at r_cut
+        self.pot = pot # the potential energy cut-and-shifted at r_cut
+        self.vir = vir # the virial
+        self.lap = lap # the Laplacian
+        self.ovr = ovr # a flag indicating overlap (i.e. pot too high to use)
+
+    def __add__(self, other):
+        cut = self.cut +  other.cut
+        pot = self.pot +  other.pot
+        vir = self.vir +  other.vir
+        lap = self.lap +  other.lap
+        ovr = self.ovr or other.ovr
+
+        return PotentialType(cut,pot,vir,lap,ovr)
+
+def introduction():
+    """Prints out introductory statements at start of run."""
+    
+    print('Lennard-Jones potential')
+    print('Cut-and-shifted version for dynamics')
+    print('Cut (but not shifted) version also calculated')
+    print('Diameter, sigma = 1')
+    print('Well depth, epsilon = 1')
+    print('Fast C force routine, vectorized using', simd_name.decode(), 'and parallelized with OpenMP')
+
+def conclusion():
+    """Prints out concluding statements at end of run."""
+
+    print('Program ends')
+
+def force ( box, r_cut, r ):
+    """Takes in box, cutoff range, and coordinate array, and calculates forces and potentials etc."""
+
+    # It is assumed that positions are in units where box = 1
+    # Forces are calculated in units where sigma = 1 and epsilon = 1
+
+    n, d = r.shape
+    assert d==3, 'Dimension error in force'
+
+    # The coordinates are handled as separate contiguous arrays of x, y and z components
+    # If r is already stored this way (Fortran order) no copy is made
+    # The forces are returned in the same layout, as an n*3 view of the component arrays
+    # Single-precision coordinates are handled by a single-precision kernel, returning single-precision forces
+    single = r.dtype == np.float32
+    r_soa  = np.ascontiguousarray ( r.T, dtype=np.float32 if single else np.float64 )
+    f_soa  = np.empty_like ( r_soa )
+    totals = np.empty ( 4 )
+
+    cdef const double[:,::1] rv
+    cdef double[:,::1]       fv
+    cdef const float[:,::1]  rv_sp
+    cdef float[:,::1]        fv_sp
+    cdef double[::1]         tv = totals
+
+    if single:
+        rv_sp, fv_sp = r_soa, f_soa
+        ovr = lj_force_simd_sp ( n, box, r_cut, &rv_sp[0,0], &rv_sp[1,0], &rv_sp[2,0],
+                                 &fv_sp[0,0], &fv_sp[1,0], &fv_sp[2,0], &tv[0] )
+    else:
+        rv, fv = r_soa, f_soa
+        ovr = lj_force_simd ( n, box, r_cut, &rv[0,0], &rv[1,0], &rv[2,0], &fv[0,0], &fv[1,0], &fv[2,0], &tv[0] )
+
+    total = PotentialType ( cut=totals[0], pot=totals[1], vir=totals[2], lap=totals[3], ovr=ovr != 0 )
+
+    return total, f_soa.T
+
+def run_block ( box, r_cut, dt, o_exp, o_ran, rng, nstep, r, v, f ):
+    """Advances positions, velocities and forces through nstep BAOAB steps, in a compiled loop.
+
+    r, v and f are n*3 arrays in Fortran order, which are updated in place; rng is a NumPy Generator.
+    Returns the final totals, the forces, and arrays of kinetic energy, squared force, pot, cut, vir and lap
+    at each step, from which the calling program computes the variables of interest.
+    """
+
+    # Each component of r, v and f is a contiguous array, so the transposes are views, not copies
+    r_soa, v_soa, f_soa = r.T, v.T, f.T
+    assert r_soa.flags.c_contiguous and v_soa.flags.c_contiguous and f_soa.flags.c_contiguous, 'Layout error in run_block'
+    assert r.dtype == v.dtype == f.dtype and r.dtype in (np.float32, np.float64), 'Type error in run_block'
+
+    # Random numbers are generated by rng for a chunk of steps at a time, limiting the memory needed
+    chunk = min ( nstep, 100 )
+    noise = np.empty ( (chunk,)+r_soa.shape, dtype=r.dtype )
+    steps = np.empty ( (nstep,6), dtype=np.float64 ) # kin, fsq, pot, cut, vir, lap at each step
+    ovr   = False
+
+    for stp in range(0,nstep,chunk): # Loop over chunks of steps
+        m = min ( chunk, nstep-stp )
+        rng.standard_normal ( out=noise[:m], dtype=noise.dtype )
+        if r.dtype == np.float32:
+            ovr_m = baoab_steps[float] ( box, r_cut, dt, o_exp, o_ran, r_soa, v_soa, f_soa, noise[:m], steps[stp:stp+m] )
+        else:
+            ovr_m = baoab_steps[double] ( box, r_cut, dt, o_exp, o_ran, r_soa, v_soa, f_soa, noise[:m], steps[stp:stp+m] )
+        ovr = ovr or ovr_m != 0
+
+    total = PotentialType ( cut=steps[-1,3], pot=steps[-1,2], vir=steps[-1,4], lap=steps[-1,5], ovr=ovr )
+
+    return total, f, steps.T
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int baoab_steps ( double box, double r_cut, double dt, double o_exp, double o_ran,
+                       real_t[:,::1] r, real_t[:,::1] v, real_t[:,::1] f, real_t[:,:,::1] noise, double[:,::1] steps ):
+    """Compiled BAOAB step loop over (3,n) arrays r, v, f, one step per block of noise, storing step totals."""
+
+    # The B, A, O and A propagators act on each coordinate independently, so they are combined in one loop
+
+    cdef Py_ssize_t stp, k, i, n = r.shape[1]
+    cdef double     half_t     = 0.5*dt
+    cdef double     half_t_box = half_t / box # Drift factor, positions in box=1 units
+    cdef double     kin, fsq
+    cdef double     totals[4]
+    cdef int        ovr = 0
+
+    for stp in range(noise.shape[0]): # Loop over steps
+
+        for k in range(3):
+            for i in range(n):
+                v[k,i] = v[k,i] + half_t*f[k,i]                     # B kick half-step
+                r[k,i] = r[k,i] + half_t_box*v[k,i]                 # A drift half-step
+                r[k,i] = r[k,i] - rint ( r[k,i] )                   # Periodic boundaries
+                v[k,i] = o_exp*v[k,i] + o_ran*noise[stp,k,i]        # O random velocities and friction step
+                r[k,i] = r[k,i] + half_t_box*v[k,i]                 # A drift half-step
+                r[k,i] = r[k,i] - rint ( r[k,i] )                   # Periodic boundaries
+
+        if real_t is float: # Force evaluation
+            ovr |= lj_force_simd_sp ( n, box, r_cut, &r[0,0], &r[1,0], &r[2,0], &f[0,0], &f[1,0], &f[2,0], totals )
+        else:
+            ovr |= lj_force_simd ( n, box, r_cut, &r[0,0], &r[1,0], &r[2,0], &f[0,0], &f[1,0], &f[2,0], totals )
+
+        kin = 0.0
+        fsq = 0.0
+        for k in range(3):
+            for i in range(n):
+                v[k,i] = v[k,i] + half_t*f[k,i] # B kick half-step
+                kin    = kin + v[k,i]*v[k,i]
+                fsq    = fsq + f[k,i]*f[k,i]
+
+        steps[stp,0] = 0.5*kin
+        steps[stp,1] = fsq
+        steps[stp,2] = totals[1] # pot
+        steps[stp,3] = totals[0] # cut
+        steps[stp,4] = totals[2] # vir
+        steps[stp,5] = totals[3] # lap
+
+    return ovr
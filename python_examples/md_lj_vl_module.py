@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# md_lj_vl_module.py
+
+#------------------------------------------------------------------------------------------------#
+# This software was written in 2016/17                                                           #
+# by Michael P. Allen <m.p.allen@warwick.ac.uk>/<m.p.allen@bristol.ac.uk>                        #
+# and Dominic J. Tildesley <d.tildesley7@gmail.com> ("the authors"),                             #
+# to accompany the book "Computer Simulation of Liquids", second edition, 2017 ("the text"),     #
+# published by Oxford University Press ("the publishers").                                       #
+#                                                                                                #
+# LICENCE                                                                                        #
+# Creative Commons CC0 Public Domain Dedication.                                                 #
+# To the extent possible under law, the authors have dedicated all copyright and related         #
+# and neighboring rights to this software to the PUBLIC domain worldwide.                        #
+# This software is distributed without any warranty.                                             #
+# You should have received a copy of the CC0 Public Domain Dedication along with this software.  #
+# If not, see <http://creativecommons.org/publicdomain/zero/1.0/>.                               #
+#                                                                                                #
+# DISCLAIMER                                                                                     #
+# The authors and publishers make no warranties about the software, and disclaim liability       #
+# for all uses of the software, to the fullest extent permitted by applicable law.               #
+# The authors and publishers do not recommend use of this software for any purpose.              #
+# It is made freely available, solely to clarify points made in the text. When using or citing   #
+# the software, you should not imply endorsement by the authors or publishers.                   #
+#------------------------------------------------------------------------------------------------#
+
+"""Force routine for MD simulation, Lennard-Jones atoms, using Verlet neighbour list, compiled with Numba."""
+
+import numpy as np
+from numba import njit, prange
+import verlet_list_module
+
+class PotentialType:
+    """A composite variable for interactions."""
+
+    __slots__ = ('cut','pot','vir','lap','ovr') # Fixed attributes, stored without an instance dictionary
+
+    def __init__(self, cut, pot, vir, lap, ovr):
+        self.cut = cut # the potential energy cut (but not shifted) at r_cut
+        self.pot = pot # the potential energy cut-and-shifted at r_cut
+        self.vir = vir # the virial
+        self.lap = lap # the Laplacian
+        self.ovr = ovr # a flag indicating overlap (i.e. pot too high to use)
+
+    def __add__(self, other):
+        cut = self.cut +  other.cut
+        pot = self.pot +  other.pot
+        vir = self.vir +  other.vir
+        lap = self.lap +  other.lap
+        ovr = self.ovr or other.ovr
+
+        return PotentialType(cut,pot,vir,lap,ovr)
+
+def introduction():
+    """Prints out introductory statements at start of run."""
+    
+    print('Lennard-Jones potential')
+    print('Cut-and-shifted version for dynamics')
+    print('Cut (but not shifted) version also calculated')
+    print('Diameter, sigma = 1')
+    print('Well depth, epsilon = 1')
+    print('Fast Numba force routine')
+    print('Uses Verlet neighbour list')
+
+def conclusion():
+    """Prints out concluding statements at end of run."""
+
+    print('Program ends')
+
+def link_cells ( box, r_cut ):
+    """Returns True if the box is large enough for the Verlet list to be built using link cells."""
+
+    return verlet_list_module.link_cells ( r_cut/box )
+
+def force ( box, r_cut, r ):
+    """Takes in box, cutoff range, and coordinate array, and calculates forces and potentials etc."""
+
+    # It is assumed that positions are in units where box = 1
+    # Forces are calculated in units where sigma = 1 and epsilon = 1
+
+    n, d = r.shape
+    assert d==3, 'Dimension error in force'
+
+    # The coordinates are handled as separate contiguous arrays of x, y and z components
+    # If r is already stored this way (Fortran order) no copy is made
+    # The forces are returned in the same layout, as an n*3 view of the component arrays
+    r_soa = np.ascontiguousarray ( r.T )
+    f_soa = np.empty_like ( r_soa )
+
+    verlet_list_module.make_list ( r_cut/box, r_soa ) # Rebuilds list only if atoms have moved far enough
+    point, nbr = verlet_list_module.point, verlet_list_module.nbr
+
+    pot, vir, lap, cut, ovr = force_soa ( box, r_cut, r_soa[0], r_soa[1], r_soa[2], point, nbr,
+                                          f_soa[0], f_soa[1], f_soa[2] )
+
+    total = PotentialType ( cut=cut, pot=pot, vir=vir, lap=lap, ovr=ovr )
+
+    return total, f_soa.T
+
+@njit ( parallel=True, fastmath=True, cache=True )
+def force_soa ( box, r_cut, rx, ry, rz, point, nbr, fx, fy, fz ):
+    """Compiled loop over neighbour list point, nbr, storing forces in fx, fy, fz and returning totals."""
+
+    # Each thread handles a set of atoms i, and loops over all its neighbours j, so each pair is visited twice
+    # This avoids any conflict between threads when accumulating the forces
+
+    n = rx.shape[0]
+
+    sr2_ovr      = 1.77 # Overlap threshold (pot > 100)
+    r_cut_box    = r_cut / box
+    r_cut_box_sq = r_cut_box ** 2
+    box_sq       = box ** 2
+
+    # Calculate potential at cutoff
+    sr2     = 1.0 / r_cut**2 # in sigma=1 units
+    sr6     = sr2 ** 3
+    sr12    = sr6 **2
+    pot_cut = sr12 - sr6 # Without numerical factor 4
+
+    # Initialize
+    cut   = 0.0
+    pot   = 0.0
+    vir   = 0.0
+    lap   = 0.0
+    n_ovr = 0
+
+    for i in prange(n): # Outer loop, shared between threads
+        fxi, fyi, fzi = 0.0, 0.0, 0.0
+        cut_i, pot_i, vir_i, lap_i, ovr_i = 0.0, 0.0, 0.0, 0.0, 0
+
+        for k in range(point[i],point[i+1]): # Inner loop over neighbour atoms (if any)
+            j    = nbr[k]                   # Neighbour atom index
+            rxij = rx[i] - rx[j]            # Separation vector
+            ryij = ry[i] - ry[j]
+            rzij = rz[i] - rz[j]
+            rxij = rxij - np.rint ( rxij )  # Periodic boundary conditions in box=1 units
+            ryij = ryij - np.rint ( ryij )
+            rzij = rzij - np.rint ( rzij )
+            rij_sq = rxij**2 + ryij**2 + rzij**2 # Squared separation
+
+            if rij_sq < r_cut_box_sq: # Check within cutoff
+                sr2 = 1.0 / ( rij_sq * box_sq ) # (sigma/rij)**2 in sigma=1 units
+                if sr2 > sr2_ovr:               # Overlap if too close
+                    ovr_i = ovr_i + 1
+
+                sr6  = sr2 ** 3
+                sr12 = sr6 ** 2
+                cutij = sr12 - sr6             # LJ pair potential (cut but not shifted)
+                virij = cutij + sr12           # LJ pair virial
+                cut_i = cut_i + cutij
+                pot_i = pot_i + cutij - pot_cut                # LJ pair potential (cut-and-shifted)
+                vir_i = vir_i + virij
+                lap_i = lap_i + ( 22.0*sr12 - 5.0*sr6 ) * sr2  # LJ pair Laplacian
+                fij   = virij * sr2                            # LJ scalar part of forces
+                fxi   = fxi + rxij * fij
+                fyi   = fyi + ryij * fij
+                fzi   = fzi + rzij * fij
+
+        fx[i] = fxi * box * 24.0 # Now in sigma=1 units, and 24*epsilon
+        fy[i] = fyi * box * 24.0
+        fz[i] = fzi * box * 24.0
+        cut   += cut_i
+        pot   += pot_i
+        vir   += vir_i
+        lap   += lap_i
+        n_ovr += ovr_i
+
+    # Multiply results by numerical factors, and correct for double-counting ij and ji
+    cut = cut * 4.0 / 2.0        # 4*epsilon
+    pot = pot * 4.0 / 2.0        # 4*epsilon
+    vir = vir * 24.0 / 3.0 / 2.0 # 24*epsilon and divide virial by 3
+    lap = lap * 24.0             # 24*epsilon, ij and ji both included
+
+    return pot, vir, lap, cut, n_ovr > 0
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# verlet_list_module.py
+
+#------------------------------------------------------------------------------------------------#
+# This software was written in 2016/17                                                           #
+# by Michael P. Allen <m.p.allen@warwick.ac.uk>/<m.p.allen@bristol.ac.uk>                        #
+# and Dominic J. Tildesley <d.tildesley7@gmail.com> ("the authors"),                             #
+# to accompany the book "Computer Simulation of Liquids", second edition, 2017 ("the text"),     #
+# published by Oxford University Press ("the publishers").                                       #
+#                                                                                                #
+# LICENCE                                                                                        #
+# Creative Commons CC0 Public Domain Dedication.                                                 #
+# To the extent possible under law, the authors have dedicated all copyright and related         #
+# and neighboring rights to this software to the PUBLIC domain worldwide.                        #
+# This software is distributed without any warranty.                                             #
+# You should have received a copy of the CC0 Public Domain Dedication along with this software.  #
+# If not, see <http://creativecommons.org/publicdomain/zero/1.0/>.                               #
+#                                                                                                #
+# DISCLAIMER                                                                                     #
+# The authors and publishers make no warranties about the software, and disclaim liability       #
+# for all uses of the software, to the fullest extent permitted by applicable law.               #
+# The authors and publishers do not recommend use of this software for any purpose.              #
+# It is made freely available, solely to clarify points made in the text. When using or citing   #
+# the software, you should not imply endorsement by the authors or publishers.                   #
+#------------------------------------------------------------------------------------------------#
+
+"""Verlet neighbour list routines, built using link cells, compiled with Numba."""
+
+import numpy as np
+from numba import njit, prange
+
+# It is assumed that all positions and displacements are divided by box
+# The list is rebuilt whenever the largest displacement since the last build exceeds half the skin
+# Each atom i has its neighbours, including those with j<i, stored in nbr[point[i]:point[i+1]]
+
+r_list_factor = 1.2 # Change this to adjust the list range, r_list = r_cut*r_list_factor
+
+# Module data, set up on first call of make_list
+point  = None # Index to neighbour list (n+1)
+nbr    = None # Verlet neighbour list
+r_save = None # Saved positions for list (3,n)
+r_list_box = 0.0 # List range parameter / box length
+r_skin_box = 0.0 # List skin parameter / box length
+
+def link_cells ( r_cut_box ):
+    """Returns True if the list will be built using link cells, rather than by checking all pairs."""
+
+    return np.floor ( 1.0 / ( r_cut_box * r_list_factor ) ) >= 3
+
+def initialize_list ( n, r_cut_box ):
+    """Sets the list range and skin, and allocates the arrays."""
+
+    global point, r_save, r_list_box, r_skin_box
+
+    print("{:40}{:15.6f}".format('Verlet list based on r_cut/box =', r_cut_box))
+    print("{:40}{:15.6f}".format('Verlet list factor = ', r_list_factor))
+    assert r_list_factor > 1.0, 'r_list_factor must be > 1'
+    assert r_cut_box < 0.5, 'r_cut/box too large'
+    r_list_box = r_cut_box * r_list_factor # May exceed 0.5, since the list holds minimum image pairs
+    r_skin_box = r_list_box - r_cut_box
+    print("{:40}{:15.6f}".format('Verlet list range (box units) = ', r_list_box))
+    print("{:40}{:15.6f}".format('Verlet list skin  (box units) = ', r_skin_box))
+
+    sc = int ( np.floor ( 1.0 / r_list_box ) ) # Number of link cells in each dimension
+    if sc < 3:
+        print('System is too small to use link cells, list built from all pairs')
+
+    point  = np.zeros ( n+1, dtype=np.int64 )
+    r_save = None
+
+def make_list ( r_cut_box, r ):
+    """Rebuilds the list, if necessary, from the (3,n) array of positions r."""
+
+    global point, nbr, r_save
+
+    n = r.shape[1]
+    if r_save is None or r_save.shape[1] != n:
+        initialize_list ( n, r_cut_box )
+    elif 4.0*max_disp_sq ( r[0], r[1], r[2], r_save[0], r_save[1], r_save[2] ) < r_skin_box**2:
+        return # No need to make list
+
+    nbr    = build_list ( r_list_box, r[0], r[1], r[2], point )
+    r_save = r.copy()
+
+@njit ( cache=True )
+def build_list ( r_list_box, rx, ry, rz, point ):
+    """Makes the list from scratch, setting point and returning nbr."""
+
+    n  = rx.shape[0]
+    sc = int ( np.floor ( 1.0 / r_list_box ) ) # Number of link cells in each dimension
+    if sc < 3:
+        sc = 1 # All atoms in one cell, so all pairs are checked
+
+    head, link  = build_cell_list ( rx, ry, rz, sc )
+    counts      = scan_cells ( rx, ry, rz, r_list_box**2, sc, head, link, point, point, False )
+    point[0]    = 0
+    point[1:]   = np.cumsum ( counts )
+    nbr         = np.empty ( point[n], dtype=np.int64 )
+    scan_cells ( rx, ry, rz, r_list_box**2, sc, head, link, point, nbr, True )
+
+    return nbr
+
+@njit ( fastmath=True, cache=True )
+def max_disp_sq ( rx, ry, rz, rx_save, ry_save, rz_save ):
+    """Returns the largest squared displacement since the last list update."""
+
+    dr_sq_max = 0.0
+    for i in range(rx.shape[0]):
+        drx = rx[i] - rx_save[i]
+        dry = ry[i] - ry_save[i]
+        drz = rz[i] - rz_save[i]
+        drx = drx - np.rint ( drx ) # Periodic boundaries in box=1 units
+        dry = dry - np.rint ( dry )
+        drz = drz - np.rint ( drz )
+        dr_sq = drx**2 + dry**2 + drz**2
+        if dr_sq > dr_sq_max:
+            dr_sq_max = dr_sq
+    return dr_sq_max
+
+@njit ( cache=True )
+def c_index ( ri, sc ):
+    """Returns the link-cell index, in range 0..sc-1, of a coordinate in box=1 units."""
+
+    return int ( np.floor ( ( ri + 0.5 ) * sc ) ) % sc
+
+@njit ( cache=True )
+def build_cell_list ( rx, ry, rz, sc ):
+    """Sorts atoms into an sc*sc*sc grid of link cells, returning head and link arrays."""
+
+    n    = rx.shape[0]
+    head = np.full ( sc**3, -1, dtype=np.int64 ) # First atom in each cell, or -1 if empty
+    link = np.empty ( n, dtype=np.int64 )        # Next atom in the same cell, or -1
+    for i in range(n):
+        c = ( c_index ( rx[i], sc ) * sc + c_index ( ry[i], sc ) ) * sc + c_index ( rz[i], sc )
+        link[i] = head[c]
+        head[c] = i
+    return head, link
+
+@njit ( parallel=True, fastmath=True, cache=True )
+def scan_cells ( rx, ry, rz, r_list_box_sq, sc, head, link, point, nbr, fill ):
+    """Counts the neighbours of each atom in the surrounding cells, and stores them in nbr if fill is True."""
+
+    # On the first pass (fill=False), nbr is not touched, and just the counts are needed
+    # On the second pass, the neighbours of atom i are stored from nbr[point[i]] onwards
+
+    n      = rx.shape[0]
+    counts = np.zeros ( n, dtype=np.int64 )
+    d_lo, d_hi = ( -1, 2 ) if sc >= 3 else ( 0, 1 ) # Only one cell if sc < 3
+
+    for i in prange(n):
+        cx = c_index ( rx[i], sc )
+        cy = c_index ( ry[i], sc )
+        cz = c_index ( rz[i], sc )
+        k  = point[i] if fill else 0
+        for dx in range(d_lo,d_hi):
+            for dy in range(d_lo,d_hi):
+                for dz in range(d_lo,d_hi):
+                    j = head[ ( ( (cx+dx)%sc ) * sc + (cy+dy)%sc ) * sc + (cz+dz)%sc ]
+                    while j >= 0: # Loop over atoms in cell
+                        if j != i:
+                            rxij = rx[i] - rx[j]
+                            ryij = ry[i] - ry[j]
+                            rzij = rz[i] - rz[j]
+                            rxij = rxij - np.rint ( rxij ) # Periodic boundary conditions in box=1 units
+                            ryij = ryij - np.rint ( ryij )
+                            rzij = rzij - np.rint ( rzij )
+                            if rxij**2 + ryij**2 + rzij**2 < r_list_box_sq:
+                                if fill:
+                                    nbr[k] = j
+                                k = k + 1
+                        j = link[j]
+        counts[i] = k - point[i] if fill else k
+
+    return counts